@@ -0,0 +1,87 @@
+import numpy as np
+from numba import njit
+
+# -----------------------------------------
+# Compiled Solver Kernels
+# -----------------------------------------
+# These kernels work on NumPy arrays only; board.py converts to and from them.
+# Compiled code is cached on disk (in __pycache__ next to this module, or under
+# NUMBA_CACHE_DIR if set, as in the Docker image), so only the first run pays for JIT.
+
+# Lookup tables over all 512 candidate masks, shared with board.py: the number of
+# set bits, and the digit of the lowest set bit (10 for an empty mask).
+POPCNT = np.array([bin(m).count("1") for m in range(512)], dtype=np.uint8)
+BIT_TO_DIGIT = np.array([(m & -m).bit_length() if m else 10 for m in range(512)], dtype=np.uint8)
+
+@njit(cache=True)
+def solve(values, row_used, col_used, box_used, row_of, col_of, box_of):
+    """
+    Solve the board in place by backtracking search, given the 9-bit used masks
+    of every row, column and block. Returns False, with the values untouched,
+    if there is no solution.
+
+    The search is iterative: depth k holds the k-th cell filled and the digits
+    still untried there. Each step picks the unsolved cell with the fewest
+    candidates (minimum remaining values); a cell with none left means backtrack.
+    """
+    empties = np.empty(81, np.int64)
+    n = 0
+    for i in range(81):
+        if values[i] == 0:
+            empties[n] = i
+            n += 1
+    untried = np.zeros(81, np.int64)
+
+    depth = 0
+    pick = True
+    while True:
+        if pick:
+            if depth == n:
+                return True
+            # Move the most constrained unsolved cell to position `depth`.
+            best = depth
+            best_mask = 0
+            best_count = 10
+            for k in range(depth, n):
+                i = empties[k]
+                mask = ~(row_used[row_of[i]] | col_used[col_of[i]] | box_used[box_of[i]]) & 0x1FF
+                count = POPCNT[mask]
+                if count < best_count:
+                    best = k
+                    best_mask = mask
+                    best_count = count
+                    if count <= 1:
+                        break
+            i = empties[best]
+            empties[best] = empties[depth]
+            empties[depth] = i
+            untried[depth] = best_mask
+            pick = False
+
+        i = empties[depth]
+        r = row_of[i]
+        c = col_of[i]
+        b = box_of[i]
+        # Undo the previous digit tried in this cell, if any.
+        if values[i] != 0:
+            bit = 1 << (values[i] - 1)
+            row_used[r] ^= bit
+            col_used[c] ^= bit
+            box_used[b] ^= bit
+            values[i] = 0
+        mask = untried[depth]
+        if mask == 0:
+            if depth == 0:
+                return False
+            depth -= 1
+            continue
+
+        # Try the lowest untried digit and go one level deeper.
+        bit = mask & -mask
+        untried[depth] = mask ^ bit
+        values[i] = BIT_TO_DIGIT[bit]
+        row_used[r] |= bit
+        col_used[c] |= bit
+        box_used[b] |= bit
+        depth += 1
+        pick = True
@@ -0,0 +1,261 @@
+from array import array
+import sys
+from collections import deque
+from typing import Dict, List, NamedTuple
+import numpy as np
+import _sudoku_core
+
+# -----------------------------------------
+# Bitboard Layout
+# -----------------------------------------
+# Cells are indexed 0..80 in row-major order (index 0 is "R1C1", index 80 is "R9C9").
+# A board is held as two flat arrays of length 81:
+#   - values:     bytearray, the solved digit (1-9) or 0 if the cell is unsolved.
+#   - candidates: array('H'), a 9-bit mask where bit (d-1) is set if digit d is a candidate.
+# CELL_KEYS[r][c] is the interned key of the cell in row r+1, column c+1.
+CELL_KEYS = tuple(tuple(sys.intern(f"R{r}C{c}") for c in range(1, 10)) for r in range(1, 10))
+ALL_CELLS = tuple(cell_ref for row in CELL_KEYS for cell_ref in row)
+CELL_INDEX = {cell_ref: i for i, cell_ref in enumerate(ALL_CELLS)}
+ALL_CANDIDATES = 0x1FF
+
+ROW_OF = tuple(i // 9 for i in range(81))
+COL_OF = tuple(i % 9 for i in range(81))
+BOX_OF = tuple((i // 27) * 3 + (i % 9) // 3 for i in range(81))
+
+# The same tables as NumPy index arrays, for gathering per-unit masks back onto cells.
+ROW_IDX = np.array(ROW_OF, dtype=np.intp)
+COL_IDX = np.array(COL_OF, dtype=np.intp)
+BOX_IDX = np.array(BOX_OF, dtype=np.intp)
+
+# The 27 units: rows 0-8, then columns 9-17, then blocks 18-26.
+UNITS = (
+    tuple(tuple(i for i in range(81) if ROW_OF[i] == n) for n in range(9))
+    + tuple(tuple(i for i in range(81) if COL_OF[i] == n) for n in range(9))
+    + tuple(tuple(i for i in range(81) if BOX_OF[i] == n) for n in range(9))
+)
+# The same units as a (27, 9) index array; row u holds the cells of unit u.
+UNIT_IDX = np.array(UNITS, dtype=np.intp)
+
+# Bit mask of each digit, indexed by value (0 for an unsolved cell).
+VALUE_BIT = np.array([0] + [1 << (d - 1) for d in range(1, 10)], dtype=np.uint16)
+
+# Lookup tables over all 512 candidate masks: the number of candidates, the digit
+# of the lowest set bit (10 for an empty mask), and that bit's index (9 when empty).
+# Defined once in _sudoku_core for the compiled solver; bytes copies index faster here.
+POPCNT = bytes(_sudoku_core.POPCNT)
+BIT_TO_DIGIT = bytes(_sudoku_core.BIT_TO_DIGIT)
+CTZ = bytes(d - 1 for d in BIT_TO_DIGIT)
+# The sorted candidate digits of every mask.
+MASK_DIGITS = tuple(tuple(d for d in range(1, 10) if m & (1 << (d - 1))) for m in range(512))
+
+# The 20 peers of each cell (same row, column or block, excluding the cell itself),
+# in ascending order. Tuples rather than sets, as they are only ever iterated.
+PEERS = tuple(
+    tuple(
+        j for j in range(81)
+        if j != i and (ROW_OF[j] == ROW_OF[i] or COL_OF[j] == COL_OF[i] or BOX_OF[j] == BOX_OF[i])
+    )
+    for i in range(81)
+)
+
+
+class Bitboard(NamedTuple):
+    """The two flat arrays of a board; unpacks as (values, cands)."""
+    values: bytearray
+    cands: array
+
+    def copy(self) -> "Bitboard":
+        return Bitboard(bytearray(self.values), array("H", self.cands))
+
+
+# -----------------------------------------
+# Conversion to and from the API format
+# -----------------------------------------
+def digits_to_mask(digits: List[int]) -> int:
+    """Convert a list of candidate digits (e.g. [1, 4, 9]) to a 9-bit mask."""
+    mask = 0
+    for d in digits:
+        if not 1 <= d <= 9:
+            raise ValueError(f"Invalid digit {d}; digits must be 1-9.")
+        mask |= 1 << (d - 1)
+    return mask
+
+def mask_to_digits(mask: int) -> List[int]:
+    """Convert a 9-bit candidate mask to a sorted list of digits."""
+    return list(MASK_DIGITS[mask])
+
+def to_bitboard(puzzle: Dict[str, dict], allow_missing: bool = False, with_candidates: bool = True) -> Bitboard:
+    """
+    Convert a puzzle dict (e.g. {"R1C1": {"value": 4, "candidates": []}, ...})
+    into a (values, candidates) bitboard.
+    With allow_missing, a cell absent from the puzzle is left empty instead of raising.
+    Without with_candidates, candidate lists are not read and every mask is left empty,
+    for callers that only need the solved values.
+    """
+    values = bytearray(81)
+    cands = array("H", [0]) * 81
+    for i, cell_ref in enumerate(ALL_CELLS):
+        cell = puzzle.get(cell_ref)
+        if cell is None:
+            if allow_missing:
+                continue
+            raise ValueError(f"Cell {cell_ref} not found in the puzzle.")
+        if not isinstance(cell, dict):
+            raise ValueError(f"Cell {cell_ref} must be an object with a value and candidates.")
+        value = cell.get("value")
+        if value is not None:
+            if not isinstance(value, int) or not 1 <= value <= 9:
+                raise ValueError(f"Invalid value {value!r} in cell {cell_ref}; values must be 1-9.")
+            values[i] = value
+        elif with_candidates:
+            cands[i] = digits_to_mask(cell.get("candidates", []))
+    return Bitboard(values, cands)
+
+def from_bitboard(values: bytearray, cands: array) -> Dict[str, dict]:
+    """
+    Convert a (values, candidates) bitboard back into the puzzle dict format.
+    """
+    return {
+        cell_ref: {
+            "value": values[i] or None,
+            "candidates": [] if values[i] else list(MASK_DIGITS[cands[i]]),
+        }
+        for i, cell_ref in enumerate(ALL_CELLS)
+    }
+
+
+# -----------------------------------------
+# Core Bitboard Operations
+# -----------------------------------------
+def compute_candidates(values: bytearray, cands: array) -> None:
+    """
+    For each unsolved cell, set its candidate mask to the digits not already
+    solved in any of its peers. Solved cells get an empty mask.
+
+    Works on NumPy views of the bitboard: the value bits of every row, column
+    and block are OR-reduced into 9 "used" masks per unit type, then gathered
+    back onto each cell through ROW_IDX, COL_IDX and BOX_IDX.
+    """
+    flat = np.frombuffer(values, dtype=np.uint8)
+    value_bits = VALUE_BIT[flat].reshape(9, 9)
+    row_used = np.bitwise_or.reduce(value_bits, axis=1)
+    col_used = np.bitwise_or.reduce(value_bits, axis=0)
+    # Viewed as (block row, row in block, block column, column in block).
+    box_used = np.bitwise_or.reduce(value_bits.reshape(3, 3, 3, 3), axis=(1, 3)).ravel()
+    used = row_used[ROW_IDX] | col_used[COL_IDX] | box_used[BOX_IDX]
+    out = np.frombuffer(cands, dtype=np.uint16)
+    out[:] = np.where(flat == 0, ~used & ALL_CANDIDATES, 0)
+
+def units_are_distinct(values: bytearray) -> bool:
+    """
+    Return True if no solved digit appears more than once in any row, column or block.
+
+    Builds a (27 units x 10 digits) histogram with a single np.bincount over
+    unit * 10 + value; bucket 0 counts unsolved cells and is ignored.
+    """
+    unit_values = np.frombuffer(values, dtype=np.uint8)[UNIT_IDX]
+    buckets = (np.arange(27)[:, None] * 10 + unit_values).ravel()
+    counts = np.bincount(buckets, minlength=270).reshape(27, 10)
+    return bool((counts[:, 1:] <= 1).all())
+
+def units_are_covered(values: bytearray, cands: array) -> bool:
+    """
+    Return True if every digit 1-9 is, in every unit, either solved or still a
+    candidate of some cell: the OR of value bits and candidate masks over each
+    unit must be 0x1FF.
+    """
+    available = VALUE_BIT[np.frombuffer(values, dtype=np.uint8)] | np.frombuffer(cands, dtype=np.uint16)
+    cover = np.bitwise_or.reduce(available[UNIT_IDX], axis=1)
+    return bool((cover == ALL_CANDIDATES).all())
+
+def _assign_inner(values: bytearray, cands: array, i: int, d: int, queue: deque) -> None:
+    """
+    Assign digit d to cell i and eliminate d from the candidates of all its peers.
+    Any peer reduced to a single candidate is appended to the queue.
+
+    A queued single is skipped if its cell was solved, or lost its digit, before
+    the queue reached it.
+    """
+    bit = 1 << (d - 1)
+    if values[i] or not cands[i] & bit:
+        return
+    values[i] = d
+    cands[i] = 0
+    for p in PEERS[i]:
+        if values[p] == 0 and cands[p] & bit:
+            cands[p] &= ~bit
+            m = cands[p]
+            if POPCNT[m] == 1:
+                queue.append((p, BIT_TO_DIGIT[m]))
+
+def _drain(values: bytearray, cands: array, queue: deque) -> None:
+    """Process queued (cell, digit) assignments until no singles remain."""
+    while queue:
+        i, d = queue.popleft()
+        _assign_inner(values, cands, i, d, queue)
+
+def assign(values: bytearray, cands: array, i: int, d: int) -> None:
+    """
+    Assign digit d to cell i, eliminate d from the candidates of all its peers,
+    and auto-assign any peer reduced to a single candidate.
+    """
+    _drain(values, cands, deque([(i, d)]))
+
+def eliminate(values: bytearray, cands: array, i: int, d: int) -> None:
+    """
+    Eliminate digit d from the candidates of cell i. If only one candidate
+    remains, that candidate is automatically assigned.
+    Raises ValueError if d is not a digit 1-9.
+    """
+    if not 1 <= d <= 9:
+        raise ValueError(f"Invalid digit {d}; digits must be 1-9.")
+    bit = 1 << (d - 1)
+    if cands[i] & bit:
+        cands[i] &= ~bit
+        m = cands[i]
+        if POPCNT[m] == 1:
+            assign(values, cands, i, BIT_TO_DIGIT[m])
+
+def scan_and_assign(values: bytearray, cands: array) -> None:
+    """
+    Assign every unsolved cell that has exactly one candidate.
+
+    All existing singles are queued in one pass, then the queue is drained;
+    any new single created along the way joins the same queue.
+    """
+    queue = deque(
+        (i, BIT_TO_DIGIT[cands[i]])
+        for i in range(81)
+        if values[i] == 0 and POPCNT[cands[i]] == 1
+    )
+    _drain(values, cands, queue)
+
+
+# -----------------------------------------
+# Search
+# -----------------------------------------
+def solve(values: bytearray) -> bool:
+    """
+    Solve the board in place by backtracking search. Returns False, leaving the
+    values untouched, if the givens conflict or the puzzle has no solution.
+
+    The solved digits of every row, column and block are collected into 9-bit
+    "used" masks here; the search itself runs in the compiled _sudoku_core.solve.
+    """
+    row_used = np.zeros(9, dtype=np.uint16)
+    col_used = np.zeros(9, dtype=np.uint16)
+    box_used = np.zeros(9, dtype=np.uint16)
+    for i in range(81):
+        d = values[i]
+        if d == 0:
+            continue
+        bit = 1 << (d - 1)
+        r, c, b = ROW_OF[i], COL_OF[i], BOX_OF[i]
+        if (row_used[r] | col_used[c] | box_used[b]) & bit:
+            return False
+        row_used[r] |= bit
+        col_used[c] |= bit
+        box_used[b] |= bit
+    return bool(_sudoku_core.solve(
+        np.frombuffer(values, dtype=np.uint8), row_used, col_used, box_used, ROW_IDX, COL_IDX, BOX_IDX
+    ))
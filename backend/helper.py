@@ -1,8 +1,31 @@
-from typing import Dict, List, Optional, Union
-from models import SudokuCell
+from typing import Dict, List, Optional, Tuple, Union
+from models import NextMove
+from board import ALL_CELLS, CELL_INDEX, CELL_KEYS, Bitboard, mask_to_digits, to_bitboard, from_bitboard
+import board
 import json
 import re
 
+# Plain-text grids: separators and whitespace are dropped, leaving one glyph per cell.
+_GRID_SEPARATORS = str.maketrans("", "", "|-+ \t\r\n")
+_GLYPH_VALUES = {"_": None, "0": None, **{str(d): d for d in range(1, 10)}}
+# Matches a whole unit reference (e.g. "R1", "C5", "B9").
+_UNIT_RE = re.compile(r"([RCB])([1-9])\Z", re.IGNORECASE)
+
+# The whole Markdown table as one format string: header and separator rows, then
+# nine labelled rows with a "{}" slot per cell, filled in row-major order.
+_MD_TEMPLATE = "\n".join(
+    ["|  | " + " | ".join(f"C{c}" for c in range(1, 10)) + " |"]
+    + ["| " + " | ".join(["---"] * 10) + " |"]
+    + [f"| R{r} | " + " | ".join(["{}"] * 9) + " |" for r in range(1, 10)]
+)
+# Rendered text of a cell value (keyed by value, None or 0 when unsolved) and of a
+# candidate mask (indexed by mask, for all 512 masks); both render as "_" when empty.
+_VALUE_STR = {None: "_", 0: "_", **{d: str(d) for d in range(1, 10)}}
+_CAND_STR = tuple(
+    "{" + ", ".join(str(d) for d in mask_to_digits(mask)) + "}" if mask else "_"
+    for mask in range(512)
+)
+
 # -----------------------------------------
 # Core Sudoku Functions (Logic)
 # -----------------------------------------
@@ -18,61 +41,35 @@ def read_puzzle_from_text(text: str) -> Dict[str, dict]:
       ...
     }
     
-    If so, validates each cell using the SudokuCell model and returns the puzzle.
+    If so, validates the cell keys and cell contents and returns the puzzle.
     Otherwise, it parses the text as a traditional puzzle (with rows of tokens).
     """
     # Attempt to interpret the text as JSON.
     try:
         data = json.loads(text)
-        # Check that the data is a dict and that keys follow the expected pattern.
-        if isinstance(data, dict):
-            valid = True
-            for key, cell in data.items():
-                if not re.match(r"R\d+C\d+", key):
-                    valid = False
-                    break
-                try:
-                    # Validate the cell data using the Pydantic model.
-                    SudokuCell(**cell)
-                except ValidationError:
-                    valid = False
-                    break
-            if valid:
-                return data
-    except Exception:
+    except ValueError:
         # If JSON parsing fails, fall through to traditional parsing.
-        pass
+        data = None
+    # Check that the data is a dict and that keys follow the expected pattern.
+    if isinstance(data, dict) and all(key in CELL_INDEX for key in data):
+        # Validate the values and candidates by packing them into a bitboard,
+        # which raises on anything that is not a digit 1-9.
+        to_bitboard(data, allow_missing=True)
+        return data
 
     # Fallback: parse the text as a traditional multiline puzzle.
-    puzzle: Dict[str, dict] = {}
-    rows = []
-    for line in text.splitlines():
-        line = line.strip()
-        if not line or line.startswith("-"):
-            continue
-        # Remove separators like '|'
-        line = line.replace("|", "")
-        tokens = line.split()
-        if tokens:
-            rows.append(tokens)
-    if len(rows) != 9:
-        raise ValueError(f"Expected 9 rows in puzzle, got {len(rows)}")
-    for row_idx, tokens in enumerate(rows, start=1):
-        if len(tokens) != 9:
-            raise ValueError(f"Expected 9 tokens in row {row_idx}, got {len(tokens)}")
-        for col_idx, token in enumerate(tokens, start=1):
-            cell_key = f"R{row_idx}C{col_idx}"
-            if token in ("_", "0"):
-                cell_value = None
-            else:
-                try:
-                    cell_value = int(token)
-                except ValueError:
-                    raise ValueError(f"Invalid token '{token}' in cell {cell_key}.")
-            # Create a SudokuCell model instance (with an empty candidate list)
-            cell_model = SudokuCell(value=cell_value, candidates=[])
-            puzzle[cell_key] = cell_model.dict()
-    return puzzle
+    # Each digit or underscore is one cell, in row-major order; separators ('|', '-', '+')
+    # and whitespace are skipped.
+    glyphs = text.translate(_GRID_SEPARATORS)
+    stray = set(glyphs).difference(_GLYPH_VALUES)
+    if stray:
+        raise ValueError(f"Unexpected characters in puzzle: {''.join(sorted(stray))!r}")
+    if len(glyphs) != 81:
+        raise ValueError(f"Expected 81 cells in puzzle, got {len(glyphs)}")
+    return {
+        cell_key: {"value": _GLYPH_VALUES[glyph], "candidates": []}
+        for cell_key, glyph in zip(ALL_CELLS, glyphs)
+    }
 
 def get_cell_contents(puzzle: Dict[str, dict], cell_ref: str) -> List[int]:
     """
@@ -97,76 +94,91 @@ def get_cell_contents(puzzle: Dict[str, dict], cell_ref: str) -> List[int]:
         #else:
         #    return "_"
 
-def get_units_for_cell(cell_ref: str) -> Dict[str, List[str]]:
+# The cell keys of each 3x3 block, indexed by board.BOX_OF (0 is the top-left block).
+_BLOCK_CELLS = tuple(tuple(ALL_CELLS[i] for i in unit) for unit in board.UNITS[18:])
+
+def _build_units_for_cell(i: int) -> Dict[str, Tuple[str, ...]]:
+    """
+    Build the row, column and block units of the cell at board index i.
+    Used once per cell to fill UNITS_FOR_CELL.
+    """
+    row_unit = CELL_KEYS[board.ROW_OF[i]]
+    col_unit = tuple(row[board.COL_OF[i]] for row in CELL_KEYS)
+    block_unit = _BLOCK_CELLS[board.BOX_OF[i]]
+    return {"row": row_unit, "col": col_unit, "block": block_unit}
+
+# Units of every cell, computed once.
+UNITS_FOR_CELL = {cell_ref: _build_units_for_cell(i) for i, cell_ref in enumerate(ALL_CELLS)}
+
+# The 20 peers of every cell (row, column and block, excluding the cell itself),
+# in row-major order.
+CELL_PEERS = {
+    cell_ref: tuple(ALL_CELLS[j] for j in board.PEERS[i])
+    for i, cell_ref in enumerate(ALL_CELLS)
+}
+
+def get_units_for_cell(cell_ref: str) -> Dict[str, Tuple[str, ...]]:
     """
     Given a cell reference (e.g. "R4C1"), returns a dict with keys:
       - 'row': all cell keys in the same row,
       - 'col': all cell keys in the same column,
       - 'block': all cell keys in the same 3×3 block.
     """
-    m = re.match(r"R(\d+)C(\d+)", cell_ref)
-    if not m:
+    units = UNITS_FOR_CELL.get(cell_ref)
+    if units is None:
         raise ValueError(f"Invalid cell reference: {cell_ref}")
-    row_num = int(m.group(1))
-    col_num = int(m.group(2))
-    row_unit = [f"R{row_num}C{c}" for c in range(1, 10)]
-    col_unit = [f"R{r}C{col_num}" for r in range(1, 10)]
-    block_row = (row_num - 1) // 3
-    block_col = (col_num - 1) // 3
-    row_start = block_row * 3 + 1
-    col_start = block_col * 3 + 1
-    block_unit = [
-        f"R{r}C{c}"
-        for r in range(row_start, row_start + 3)
-        for c in range(col_start, col_start + 3)
-    ]
-    return {"row": row_unit, "col": col_unit, "block": block_unit}
+    return units
+
+def get_peers_for_cell(cell_ref: str) -> Tuple[str, ...]:
+    """
+    Given a cell reference (e.g. "R4C1"), returns the cell keys of all its peers
+    (same row, column or block), excluding the cell itself.
+    """
+    peers = CELL_PEERS.get(cell_ref)
+    if peers is None:
+        raise ValueError(f"Invalid cell reference: {cell_ref}")
+    return peers
 
 def compute_candidates(puzzle: Dict[str, dict]) -> Dict[str, dict]:
     """
     For each unsolved cell, compute candidate digits (those not already in its row,
     column, or block) and update the puzzle in place.
+    Existing candidate lists are not read, as they are all recomputed.
     """
-    for cell_ref, cell in puzzle.items():
-        if cell["value"] is not None:
-            cell["candidates"] = []
-            continue
-        used_digits = set()
-        units = get_units_for_cell(cell_ref)
-        for unit in units.values():
-            for peer in unit:
-                peer_value = puzzle[peer]["value"]
-                if peer_value is not None:
-                    used_digits.add(peer_value)
-        cell["candidates"] = [d for d in range(1, 10) if d not in used_digits]
+    values, cands = to_bitboard(puzzle, with_candidates=False)
+    board.compute_candidates(values, cands)
+    puzzle.update(from_bitboard(values, cands))
     return puzzle
 
+def _assign_digit(bb: Bitboard, cell_ref: str, digit: int) -> None:
+    """assign_digit() on a bitboard, with the same checks."""
+    i = CELL_INDEX.get(cell_ref)
+    if i is None:
+        raise ValueError(f"Cell {cell_ref} not found in the puzzle.")
+    if bb.values[i]:
+        raise ValueError(f"Cell {cell_ref} is already solved with value {bb.values[i]}.")
+    if not 1 <= digit <= 9 or not bb.cands[i] & (1 << (digit - 1)):
+        raise ValueError(f"Digit {digit} is not a candidate for cell {cell_ref}.")
+    board.assign(bb.values, bb.cands, i, digit)
+
+def _eliminate_digit(bb: Bitboard, cell_ref: str, digit: int) -> None:
+    """eliminate_digit() on a bitboard, with the same checks."""
+    i = CELL_INDEX.get(cell_ref)
+    if i is None:
+        raise ValueError(f"Cell {cell_ref} not found.")
+    if bb.values[i]:
+        raise ValueError(f"Cannot eliminate digit from cell {cell_ref} because it is already solved.")
+    board.eliminate(bb.values, bb.cands, i, digit)
+
 def assign_digit(puzzle: Dict[str, dict], cell_ref: str, digit: int) -> Dict[str, dict]:
     """
     Assigns a digit to a cell if it is unsolved and the digit is in its candidate list.
     Also eliminates that digit from the candidate lists of all peers (row, col, block)
     and auto-assigns any peers reduced to a single candidate.
     """
-    cell = puzzle.get(cell_ref)
-    if cell is None:
-        raise ValueError(f"Cell {cell_ref} not found in the puzzle.")
-    if cell["value"] is not None:
-        raise ValueError(f"Cell {cell_ref} is already solved with value {cell['value']}.")
-    if digit not in cell["candidates"]:
-        raise ValueError(f"Digit {digit} is not a candidate for cell {cell_ref}.")
-    cell["value"] = digit
-    cell["candidates"] = []
-    units = get_units_for_cell(cell_ref)
-    for unit in units.values():
-        for peer_ref in unit:
-            if peer_ref == cell_ref:
-                continue
-            peer = puzzle[peer_ref]
-            if peer["value"] is None and digit in peer["candidates"]:
-                peer["candidates"].remove(digit)
-                if len(peer["candidates"]) == 1:
-                    sole_candidate = peer["candidates"][0]
-                    assign_digit(puzzle, peer_ref, sole_candidate)
+    bb = to_bitboard(puzzle)
+    _assign_digit(bb, cell_ref, digit)
+    puzzle.update(from_bitboard(*bb))
     return puzzle
 
 def eliminate_digit(puzzle: Dict[str, dict], cell_ref: str, digit: int) -> Dict[str, dict]:
@@ -174,93 +186,123 @@ def eliminate_digit(puzzle: Dict[str, dict], cell_ref: str, digit: int) -> Dict[
     Eliminates a digit from a cell’s candidate list (if the cell is unsolved).
     If the elimination leaves only one candidate, that candidate is automatically assigned.
     """
-    cell = puzzle.get(cell_ref)
-    if cell is None:
-        raise ValueError(f"Cell {cell_ref} not found.")
-    if cell["value"] is not None:
-        raise ValueError(f"Cannot eliminate digit from cell {cell_ref} because it is already solved.")
-    if digit in cell["candidates"]:
-        cell["candidates"].remove(digit)
-        # If only one candidate remains, assign that candidate automatically.
-        if len(cell["candidates"]) == 1:
-            sole_candidate = cell["candidates"][0]
-            assign_digit(puzzle, cell_ref, sole_candidate)
+    bb = to_bitboard(puzzle)
+    _eliminate_digit(bb, cell_ref, digit)
+    puzzle.update(from_bitboard(*bb))
     return puzzle
 
 def scan_and_assign(puzzle: Dict[str, dict]) -> Dict[str, dict]:
     """
-    Repeatedly scans the board and assigns a digit to any unsolved cell that has
-    exactly one candidate.
-    """
-    progress = True
-    while progress:
-        progress = False
-        for cell_ref, cell in list(puzzle.items()):
-            if cell["value"] is None and len(cell["candidates"]) == 1:
-                candidate = cell["candidates"][0]
-                assign_digit(puzzle, cell_ref, candidate)
-                progress = True
+    Assigns a digit to every unsolved cell that has exactly one candidate,
+    including any cells reduced to a single candidate along the way.
+    """
+    values, cands = to_bitboard(puzzle)
+    board.scan_and_assign(values, cands)
+    puzzle.update(from_bitboard(values, cands))
     return puzzle
 
-def get_unit(puzzle: Dict[str, dict], unit_ref: str) -> Dict[str, dict]:
+def solve_puzzle(puzzle: Dict[str, dict]) -> Dict[str, dict]:
     """
-    Returns a dictionary of cells for a given unit reference:
+    Solves the puzzle outright by backtracking search from its solved cells,
+    ignoring any candidate lists, and updates the puzzle in place.
+    Raises ValueError if the puzzle has no solution.
+    """
+    values, cands = to_bitboard(puzzle, with_candidates=False)
+    if not board.solve(values):
+        raise ValueError("The puzzle has no solution.")
+    puzzle.update(from_bitboard(values, cands))
+    return puzzle
+
+def apply_moves(puzzle: Dict[str, dict], moves: List[NextMove]) -> List[NextMove]:
+    """
+    Applies the steps of each move in order, checking strict consistency after every move.
+    Stops at the first move whose steps cannot be applied or that leaves the puzzle
+    inconsistent; that move and the ones after it are discarded.
+    Updates the puzzle in place and returns the moves that were applied.
+
+    The moves are played on a single bitboard; each move works on a copy of it,
+    which replaces the board only once the move has gone through.
+    """
+    bb = to_bitboard(puzzle)
+    applied = []
+    for move in moves:
+        trial = bb.copy()
+        try:
+            for step in move.steps:
+                if step.action == "assign":
+                    _assign_digit(trial, step.cell, step.digit)
+                elif step.action == "eliminate":
+                    _eliminate_digit(trial, step.cell, step.digit)
+                else:
+                    raise ValueError(f"Unknown action '{step.action}' for cell {step.cell}.")
+        except ValueError:
+            break
+        if not board.units_are_distinct(trial.values):
+            break
+        bb = trial
+        applied.append(move)
+    if applied:
+        puzzle.update(from_bitboard(*bb))
+    return applied
+
+def get_unit_keys(unit_ref: str) -> List[str]:
+    """
+    Returns the cell keys for a given unit reference:
       - "R1" returns row 1,
       - "C1" returns column 1,
       - "B1" returns block 1 (top-left block).
     """
-    unit_type = unit_ref[0].upper()
-    try:
-        index = int(unit_ref[1:])
-    except ValueError:
-        raise ValueError(f"Invalid unit reference: {unit_ref}")
+    m = _UNIT_RE.match(unit_ref)
+    if not m:
+        raise ValueError(f"Invalid unit reference: {unit_ref}. Expected 'R', 'C', or 'B' followed by 1-9.")
+    unit_type = m.group(1).upper()
+    index = int(m.group(2))
     if unit_type == "R":
-        keys = [f"R{index}C{c}" for c in range(1, 10)]
+        keys = list(CELL_KEYS[index - 1])
     elif unit_type == "C":
-        keys = [f"R{r}C{index}" for r in range(1, 10)]
-    elif unit_type == "B":
-        row_start = ((index - 1) // 3) * 3 + 1
-        col_start = ((index - 1) % 3) * 3 + 1
-        keys = [f"R{r}C{c}" for r in range(row_start, row_start + 3)
-                              for c in range(col_start, col_start + 3)]
+        keys = [row[index - 1] for row in CELL_KEYS]
     else:
-        raise ValueError("Unit reference must start with 'R', 'C', or 'B'.")
+        keys = list(_BLOCK_CELLS[index - 1])
+    return keys
+
+# All 27 unit references and their cell keys, computed once from board.UNITS
+# (rows, then columns, then blocks, in the same order as the references).
+ALL_UNIT_REFS = tuple(
+    [f"R{i}" for i in range(1, 10)] +
+    [f"C{i}" for i in range(1, 10)] +
+    [f"B{i}" for i in range(1, 10)]
+)
+UNIT_KEYS = {
+    unit_ref: tuple(ALL_CELLS[i] for i in unit)
+    for unit_ref, unit in zip(ALL_UNIT_REFS, board.UNITS)
+}
+
+def get_unit(puzzle: Dict[str, dict], unit_ref: str) -> Dict[str, dict]:
+    """
+    Returns a dictionary of cells for a given unit reference:
+      - "R1" returns row 1,
+      - "C1" returns column 1,
+      - "B1" returns block 1 (top-left block).
+    """
+    keys = UNIT_KEYS.get(unit_ref) or get_unit_keys(unit_ref)
     return {k: puzzle[k] for k in keys if k in puzzle}
 
 def check_strict_consistency(puzzle: Dict[str, dict]) -> bool:
     """
     In every unit (row, column, block), ensures no solved digit appears more than once.
+    Missing cells are treated as unsolved.
     """
-    unit_refs = [f"R{i}" for i in range(1, 10)] + \
-                [f"C{i}" for i in range(1, 10)] + \
-                [f"B{i}" for i in range(1, 10)]
-    for unit_ref in unit_refs:
-        unit_cells = get_unit(puzzle, unit_ref)
-        seen = {}
-        for cell_key, cell in unit_cells.items():
-            if cell["value"] is not None:
-                digit = cell["value"]
-                if digit in seen:
-                    return False
-                seen[digit] = cell_key
-    return True
+    values, _ = to_bitboard(puzzle, allow_missing=True, with_candidates=False)
+    return board.units_are_distinct(values)
 
 def check_candidate_consistency(puzzle: Dict[str, dict]) -> bool:
     """
     In every unit, for every digit 1-9, either the digit is solved in that unit
     or it appears in at least one unsolved cell's candidate list.
+    Missing cells are treated as empty.
     """
-    unit_refs = [f"R{i}" for i in range(1, 10)] + \
-                [f"C{i}" for i in range(1, 10)] + \
-                [f"B{i}" for i in range(1, 10)]
-    for unit_ref in unit_refs:
-        unit_cells = get_unit(puzzle, unit_ref)
-        solved_digits = {cell["value"] for cell in unit_cells.values() if cell["value"] is not None}
-        for d in range(1, 10):
-            if d not in solved_digits:
-                if not any(d in cell["candidates"] for cell in unit_cells.values() if cell["value"] is None):
-                    return False
-    return True
+    values, cands = to_bitboard(puzzle, allow_missing=True)
+    return board.units_are_covered(values, cands)
 
 def find_assigned_peer(puzzle: Dict[str, dict], cell_ref: str, digit: int) -> Optional[str]:
     """
@@ -269,14 +311,10 @@ def find_assigned_peer(puzzle: Dict[str, dict], cell_ref: str, digit: int) -> Op
     If the digit is assigned in any other cell in those units,
     return the cell reference of that cell; otherwise, return None.
     """
-    units = get_units_for_cell(cell_ref)
-    for unit in units.values():
-        for peer in unit:
-            if peer == cell_ref:
-                continue
-            peer_cell = puzzle.get(peer)
-            if peer_cell and peer_cell["value"] == digit:
-                return peer
+    for peer in get_peers_for_cell(cell_ref):
+        peer_cell = puzzle.get(peer)
+        if peer_cell and peer_cell["value"] == digit:
+            return peer
     return None
 
 def find_candidate_peers(puzzle: Dict[str, dict], cell_ref: str, digit: int) -> Optional[List[str]]:
@@ -287,16 +325,12 @@ def find_candidate_peers(puzzle: Dict[str, dict], cell_ref: str, digit: int) ->
     that have the given digit in their candidate lists.
     If no cell has that digit in its candidate list, return None.
     """
-    result = set()  # use a set for uniqueness
-    units = get_units_for_cell(cell_ref)
-    for unit in units.values():
-        for peer in unit:
-            if peer == cell_ref:
-                continue
-            peer_cell = puzzle.get(peer)
-            if peer_cell and peer_cell["value"] is None and digit in peer_cell["candidates"]:
-                result.add(peer)
-    return list(result) if result else None
+    result = []
+    for peer in get_peers_for_cell(cell_ref):
+        peer_cell = puzzle.get(peer)
+        if peer_cell and peer_cell["value"] is None and digit in peer_cell["candidates"]:
+            result.append(peer)
+    return result if result else None
 
 def find_identical_candidates_peers(puzzle: Dict[str, dict], cell_ref: str) -> Optional[List[str]]:
     """
@@ -307,22 +341,19 @@ def find_identical_candidates_peers(puzzle: Dict[str, dict], cell_ref: str) -> O
     Candidate lists are compared as sorted lists.
     Return None if no such cells are found.
     """
-    result = set()
+    result = []
     base_cell = puzzle.get(cell_ref)
     if base_cell is None:
         raise ValueError(f"Cell {cell_ref} not found in puzzle.")
     base_candidates = sorted(base_cell.get("candidates", []))
-    units = get_units_for_cell(cell_ref)
-    for unit in units.values():
-        for peer in unit:
-            if peer == cell_ref:
-                continue
-            peer_cell = puzzle.get(peer)
-            if peer_cell and peer_cell["value"] is None:
-                peer_candidates = sorted(peer_cell.get("candidates", []))
-                if base_candidates == peer_candidates:
-                    result.add(peer)
-    return list(result) if result else None
+    for peer in get_peers_for_cell(cell_ref):
+        peer_cell = puzzle.get(peer)
+        if peer_cell and peer_cell["value"] is None:
+            peer_candidates = peer_cell.get("candidates", [])
+            # Only sort the peers whose lists are the right length.
+            if len(peer_candidates) == len(base_candidates) and sorted(peer_candidates) == base_candidates:
+                result.append(peer)
+    return result if result else None
 
 def find_subset_candidates_peers(puzzle: Dict[str, dict], cell_ref: str, candidate_list: List[int]) -> Optional[List[str]]:
     """
@@ -331,19 +362,14 @@ def find_subset_candidates_peers(puzzle: Dict[str, dict], cell_ref: str, candida
     for which the candidate list is a subset of the provided candidate list.
     Return None if no such cells are found.
     """
-    result = set()
+    result = []
     candidate_set = set(candidate_list)
-    units = get_units_for_cell(cell_ref)
-    for unit in units.values():
-        for peer in unit:
-            if peer == cell_ref:
-                continue
-            peer_cell = puzzle.get(peer)
-            if peer_cell and peer_cell["value"] is None:
-                peer_candidates = set(peer_cell.get("candidates", []))
-                if peer_candidates.issubset(candidate_set):
-                    result.add(peer)
-    return list(result) if result else None
+    for peer in get_peers_for_cell(cell_ref):
+        peer_cell = puzzle.get(peer)
+        if peer_cell and peer_cell["value"] is None:
+            if candidate_set.issuperset(peer_cell.get("candidates", [])):
+                result.append(peer)
+    return result if result else None
 
 def render_puzzle(
     puzzle: Dict[str, dict],
@@ -379,49 +405,30 @@ def render_puzzle(
     """
     if as_json:
         return json.dumps(puzzle, indent=2)
-    
-    elif as_markdown:
-        # Create header row
-        header = [""] + [f"C{col}" for col in range(1, 10)]
-        table_rows = [header, ["---"] * len(header)]
-        for r in range(1, 10):
-            row_label = f"R{r}"
-            row_data = [row_label]
-            for c in range(1, 10):
-                cell = puzzle[f"R{r}C{c}"]
-                if cell["value"] is not None:
-                    cell_str = str(cell["value"])
-                else:
-                    if show_candidates and cell["candidates"]:
-                        candidates = sorted(cell["candidates"])
-                        cell_str = "{" + ", ".join(str(d) for d in candidates) + "}"
-                    else:
-                        cell_str = "_"
-                row_data.append(cell_str)
-            table_rows.append(row_data)
-        # Build a Markdown table
-        lines = ["| " + " | ".join(row) + " |" for row in table_rows]
-        return "\n".join(lines)
+
+    # Render every cell in a single pass, in row-major order. Candidate lists are
+    # only decoded, through the bitboard, when they are shown.
+    if show_candidates:
+        values, cands = to_bitboard(puzzle)
+        cell_strs = [
+            _VALUE_STR[value] if value else _CAND_STR[mask]
+            for value, mask in zip(values, cands)
+        ]
+    else:
+        cell_strs = [_VALUE_STR[puzzle[cell_key]["value"]] for cell_key in ALL_CELLS]
+
+    if as_markdown:
+        # Fill the Markdown table with row and column headers in one call.
+        return _MD_TEMPLATE.format(*cell_strs)
     
     else:
         # Plain text representation with 3x3 block separators.
         lines = []
-        for r in range(1, 10):
-            row_cells = []
-            for c in range(1, 10):
-                cell = puzzle[f"R{r}C{c}"]
-                if cell["value"] is not None:
-                    cell_str = str(cell["value"])
-                else:
-                    if show_candidates and cell["candidates"]:
-                        candidates = sorted(cell["candidates"])
-                        cell_str = "{" + ", ".join(str(d) for d in candidates) + "}"
-                    else:
-                        cell_str = "_"
-                row_cells.append(cell_str)
+        for r in range(9):
+            row_cells = cell_strs[r * 9:r * 9 + 9]
             # Group the row into three groups (for block separation)
             row_line = " | ".join([" ".join(row_cells[i:i+3]) for i in range(0, 9, 3)])
             lines.append(row_line)
-            if r % 3 == 0 and r < 9:
+            if r % 3 == 2 and r < 8:
                 lines.append("-" * len(row_line))
-        return "\n".join(lines)
\ No newline at end of file
+        return "\n".join(lines)
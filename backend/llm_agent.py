@@ -1,9 +1,12 @@
-from typing import Dict
-from models import NextMove
-from openai import OpenAI
+from typing import Callable, Dict, List
+from models import NextMove, NextMoves
+from openai import OpenAI, AsyncOpenAI
 from helper import *
+import asyncio
 import os
-import json
+import orjson
+import hashlib
+import time
 
 # OpenAI API Key (ensure this is secured in a real-world app, like using environment variables)
 client = OpenAI(
@@ -11,21 +14,33 @@ client = OpenAI(
     organization = os.getenv('OPENAI_ORGANIZATION_ID')
 )
 
-# Strip pretext and posttext.
-def strip_pre_post(text):
-  # Find the start index of the first '[' character
-  # and the end index of the first ']' character after '['
-  start = text.find('[')
-  end = text.rfind(']')
+# Async client for running many puzzles concurrently. The SDK retries rate-limited (429)
+# and server errors with exponential backoff.
+async_client = AsyncOpenAI(
+    api_key  = os.getenv('OPENAI_API_KEY'),
+    organization = os.getenv('OPENAI_ORGANIZATION_ID'),
+    max_retries = 5
+)
+
+# Maximum number of LLM conversations in flight at once for batch proposals.
+MAX_CONCURRENT_REQUESTS = int(os.getenv('SUDOKU_MAX_CONCURRENT_REQUESTS', '48'))
+
+# Model used for all LLM calls. The moves are validated locally, so a fast non-reasoning
+# model is enough (e.g. set OPENAI_MODEL=gpt-4o-mini for cheaper solves).
+LLM_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4o-2024-08-06')
 
-  # Check if both brackets were found
-  if start != -1 and end != -1 and end > start:
-    # Extract the text from '[' to ']'
-    content = text[start + 1 : end]
-  else:
-    content = text
+# Maximum number of independent moves to request from the LLM in one round-trip.
+MAX_MOVES = int(os.getenv('SUDOKU_MAX_MOVES', '5'))
 
-  return content
+# Structured Outputs: the LLM reply is constrained to the NextMoves JSON schema.
+next_moves_response_format = {
+  "type": "json_schema",
+  "json_schema": {
+    "name": "next_moves",
+    "schema": NextMoves.model_json_schema(),
+    "strict": True
+  }
+}
 
 
 # -----------------------------------------
@@ -128,6 +143,9 @@ sudoku_function_schemas = [
     find_subset_candidates_peers_schema
 ]
 
+# The same schemas in the "tools" format, which lets the LLM request several calls in one turn.
+sudoku_tools = [{"type": "function", "function": schema} for schema in sudoku_function_schemas]
+
 
 # -----------------------------------------
 # LLM Agentic Function Wrappers
@@ -199,15 +217,14 @@ def find_subset_candidates_peers_schema_fn(puzzle: Dict[str, dict], arguments:di
     LLM Function wrapper for find_subset_candidates_peers.
     """
     cell_ref = arguments.get('cell_ref')
-    candidate_list_str = arguments.get('candidate_list')
+    candidate_list_raw = arguments.get('candidate_list') or []
 
-    # Attempt to convert to integer list.
+    # The schema declares an array of integers, so only the items need coercing.
     try:
-        numbers = re.findall(r'-?\d+', candidate_list_str)
-        candidate_list = [int(num) for num in numbers]
+        candidate_list = [int(x) for x in candidate_list_raw]
     except (ValueError, TypeError) as e:
         print(f"CRITICAL: find_subset_candidates_peers_schema_fn - Error: {e}")
-        return {"error": f"Invalid input data: {e}"}
+        return {"error": f"Invalid candidate_list: {e}"}
     
     try:
         peers = find_subset_candidates_peers(puzzle=puzzle, cell_ref=cell_ref, candidate_list=candidate_list)
@@ -217,6 +234,15 @@ def find_subset_candidates_peers_schema_fn(puzzle: Dict[str, dict], arguments:di
     
     return {"peers": peers}
 
+# Map each tool name the LLM can call to its wrapper.
+TOOL_DISPATCH: Dict[str, Callable[[Dict[str, dict], dict], dict]] = {
+    "get_cell_contents_schema_fn": get_cell_contents_schema_fn,
+    "find_assigned_peer_schema_fn": find_assigned_peer_schema_fn,
+    "find_candidate_peers_schema_fn": find_candidate_peers_schema_fn,
+    "find_identical_candidates_peers_schema_fn": find_identical_candidates_peers_schema_fn,
+    "find_subset_candidates_peers_schema_fn": find_subset_candidates_peers_schema_fn,
+}
+
 # -----------------------------------------
 # LLM Calls (OpenAI)
 # -----------------------------------------
@@ -224,75 +250,166 @@ def propose_next_move(puzzle: Dict[str, dict]) -> NextMove:
     """
     Given a puzzle (JSON/dict) representing the sudoku board, call the OpenAI LLM
     to propose the next move. The function returns a NextMove instance.
+    Raises ValueError if the LLM proposed no move.
+    """
+    next_moves = propose_next_moves(puzzle, max_moves=1)
+    if not next_moves:
+        raise ValueError("The LLM proposed no move.")
+    return next_moves[0]
+
+def propose_next_moves(puzzle: Dict[str, dict], max_moves: int = MAX_MOVES) -> List[NextMove]:
+    """
+    Given a puzzle (JSON/dict) representing the sudoku board, call the OpenAI LLM
+    to propose up to max_moves independent next moves in a single round-trip.
+    The function returns a list of NextMove instances.
     """
     # Convert the puzzle to a text representation
-    puzzle_str = json.dumps(puzzle)
+    puzzle_json = orjson.dumps(puzzle)
+    puzzle_str = puzzle_json.decode()
 
-    # In-memory conversation store
-    conversation_history = []
+    # In-memory conversation store. The prompts are built once; tool calls and their
+    # results are appended, so every request shares the same cacheable prefix.
+    messages = build_messages(puzzle_str, max_moves)
+    prompt_cache_key = hashlib.sha256(puzzle_json).hexdigest()
 
     # Call the LLM.
-    assistant_message = call_llm(puzzle_str, conversation_history)
+    assistant_message = call_llm(messages, prompt_cache_key)
+
+    # Check if assistant wants to call tools.
+    while assistant_message.tool_calls:
+        if not execute_tool_calls(puzzle, assistant_message, messages):
+            return []
+        # Continue the conversation
+        assistant_message = call_llm(messages, prompt_cache_key)
 
-    # Check if assistant wants to call a function
-    while assistant_message.function_call:
-        function_name = assistant_message.function_call.name
-        arguments = json.loads(assistant_message.function_call.arguments)
+    return parse_next_moves(assistant_message, max_moves)
+
+async def propose_next_moves_async(puzzle: Dict[str, dict], max_moves: int = MAX_MOVES) -> List[NextMove]:
+    """
+    Async version of propose_next_moves, using the async OpenAI client.
+    """
+    puzzle_json = orjson.dumps(puzzle)
+    messages = build_messages(puzzle_json.decode(), max_moves)
+    prompt_cache_key = hashlib.sha256(puzzle_json).hexdigest()
+
+    assistant_message = await call_llm_async(messages, prompt_cache_key)
+    while assistant_message.tool_calls:
+        if not execute_tool_calls(puzzle, assistant_message, messages):
+            return []
+        assistant_message = await call_llm_async(messages, prompt_cache_key)
+
+    return parse_next_moves(assistant_message, max_moves)
+
+async def propose_next_moves_many(
+    puzzles: List[Dict[str, dict]],
+    max_moves: int = MAX_MOVES,
+    max_concurrent: int = MAX_CONCURRENT_REQUESTS
+) -> List[List[NextMove]]:
+    """
+    Given a list of puzzles, propose the next moves for each of them concurrently,
+    with at most max_concurrent conversations in flight. Returns the moves for each
+    puzzle in the same order; a puzzle whose conversation failed gets an empty list.
+    """
+    semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def propose(puzzle: Dict[str, dict]) -> List[NextMove]:
+        async with semaphore:
+            return await propose_next_moves_async(puzzle, max_moves)
+
+    results = await asyncio.gather(*[propose(puzzle) for puzzle in puzzles], return_exceptions=True)
+    next_moves = []
+    for result in results:
+        if isinstance(result, BaseException):
+            print(f"CRITICAL: propose_next_moves_many - Error: {result}")
+            result = []
+        next_moves.append(result)
+    return next_moves
+
+def execute_tool_calls(puzzle: Dict[str, dict], assistant_message, messages: List[dict]) -> bool:
+    """
+    Execute all the tool calls of an assistant turn and append the turn and the results
+    to the messages. Several independent calls may come in one turn; they are all executed
+    before the results are sent back in a single follow-up.
+    Returns False if any of the functions failed.
+    """
+    # Echo back only the fields of an assistant input message, not the whole response object.
+    messages.append({
+        "role": "assistant",
+        "content": assistant_message.content,
+        "tool_calls": [
+            {
+                "id": tool_call.id,
+                "type": "function",
+                "function": {
+                    "name": tool_call.function.name,
+                    "arguments": tool_call.function.arguments,
+                },
+            }
+            for tool_call in assistant_message.tool_calls
+        ],
+    })
+
+    for tool_call in assistant_message.tool_calls:
+        function_name = tool_call.function.name
+        arguments = orjson.loads(tool_call.function.arguments)
 
         # Execute the function and add the response to the conversation.
-        if function_name:
-            print(f"INFO: Calling function: \"{function_name}\" with arguments: {arguments}")
-    
-            if function_name == "get_cell_contents_schema_fn":
-                function_response = get_cell_contents_schema_fn(puzzle, arguments)
-            elif function_name == "find_assigned_peer_schema_fn":
-                function_response = find_assigned_peer_schema_fn(puzzle, arguments)
-            elif function_name == "find_candidate_peers_schema_fn":
-                function_response = find_candidate_peers_schema_fn(puzzle, arguments)
-            elif function_name == "find_identical_candidates_peers_schema_fn":
-                function_response = find_identical_candidates_peers_schema_fn(puzzle, arguments)
-            elif function_name == "find_subset_candidates_peers_schema_fn":
-                function_response = find_subset_candidates_peers_schema_fn(puzzle, arguments)
+        print(f"INFO: Calling function: \"{function_name}\" with arguments: {arguments}")
+        handler = TOOL_DISPATCH.get(function_name)
+        if handler is None:
+            function_response = {"error": f"Unknown tool {function_name}"}
+        else:
+            function_response = handler(puzzle, arguments)
 
         if function_response.get("error"):
             print(f"CRITICAL: propose_next_move - Function {function_name} error: {function_response.get('error')}")
-            return
+            return False
         
         print(f"INFO:   Function Reply: {function_response}")
         
-        conversation_history.append({
-            "role": "function",
-            "name": function_name,
-            "content": json.dumps(function_response),
+        messages.append({
+            "role": "tool",
+            "tool_call_id": tool_call.id,
+            "content": orjson.dumps(function_response).decode(),
         })
-    
-        # Continue the conversation
-        assistant_message = call_llm(puzzle_str, conversation_history)
-    
+    return True
+
+def parse_next_moves(assistant_message, max_moves: int = MAX_MOVES) -> List[NextMove]:
+    """
+    Parse the final assistant message into at most max_moves NextMove instances.
+    """
     # Ensure there is content for the assistant's message.  
     if assistant_message.content is None:
-        assistant_message.content = "I am sorry, I am not able to process your request."
-    else:
-        # Extract the LLM's reply
-        answer = strip_pre_post(
-            assistant_message.content.strip()
-        )
+        return []
 
-        # print(f"INFO: LLM Response: {answer}\n")
+    # The reply is constrained to the NextMoves schema, so it can be validated directly.
+    try:
+        next_moves = NextMoves.model_validate_json(assistant_message.content)
+        return next_moves.moves[:max_moves]
+    except Exception as e:
+        raise ValueError("CRITICAL: Failed to parse LLM response: " + str(e))
 
-        try:
-            data = json.loads(answer)
-            next_move = NextMove(**data)
-            return next_move
-        except Exception as e:
-            raise ValueError("CRITICAL: Failed to parse LLM response: " + str(e))
+def build_messages(puzzle_str: str, max_moves: int = MAX_MOVES, with_tools: bool = True) -> List[dict]:
+    """
+    Build the system and user prompts for the given puzzle (as a JSON string).
+    Pass with_tools=False when the request carries no tool schemas (e.g. the Batch API
+    path), so that the prompt does not tell the model to call helper functions.
+    """
+    if with_tools:
+        tool_instructions = (
+            "Use the helper functions (whose schemas are provided) to inspect the board and verify your answer. Do not assume any digit is in a cell without checking with these functions.\n"
+            "When you need several helper function results, request them all at once.\n\n"
+        )
+    else:
+        tool_instructions = (
+            "Work only from the board data provided. Do not assume any digit is in a cell unless it is the cell's value or in its candidate list.\n\n"
+        )
 
-def call_llm(puzzle_str: str, conversation_history: List[str]):
     # Create a prompt for the LLM.
     system_prompt = (
-        "You are an expert sudoku solving agent. Your task is to analyze the current puzzle board and propose the next move without modifying the board.\n"
-#        "Use the helper functions (whose schemas are provided) to inspect the board and verify your answer. Do not assume any digit is in a cell without checking with these functions.\n\n"
-        "Output only a JSON array containing one object with the keys:\n"
+        "You are an expert sudoku solving agent. Your task is to analyze the current puzzle board and propose the next moves without modifying the board.\n"
+        + tool_instructions
+        + f"Output only a JSON object whose \"moves\" key is a list of up to {max_moves} independent next moves, each being an object with the keys:\n"
         "\"strategy\": the name of the solving technique used\n"
         "\"reasoning\": a detailed explanation of your reasoning\n"
         "\"steps\": a list of steps to achieve the strategy\n"
@@ -311,34 +428,139 @@ def call_llm(puzzle_str: str, conversation_history: List[str]):
         f"{puzzle_str}\n\n"
         "A solved cell is represented by its digit under the key \"value\".\n"
         "An unsolved cell has null for value but has a candidate list under the key \"candidates\", which contains a list of the possible digits that can be likely for this cell.\n"
-        "Analyze the board and propose the next move based solely on the data provided.\n\n"
-        "Output only a JSON array:\n"
-        "[\n"
-        "  {\n"
-        "    \"strategy\": \"xxxx\",\n"
-        "    \"reasoning\": \"xxxx\",\n" 
-        "    \"steps\": [\n"
-        "      { \"cell\": \"RxCy\",\n"
-        "        \"action\": \"'assign' or 'eliminate'\",\n"
-        "        \"digit\": x\n"
-        "      },\n"
-        "      { ... }\n"
-        "  }\n"
-        "]\n"
+        "Analyze the board and propose the next moves based solely on the data provided.\n"
+        f"Each move must be deducible from the current board on its own. Propose at most {max_moves} moves.\n\n"
+        "Output only a JSON object:\n"
+        "{\n"
+        "  \"moves\": [\n"
+        "    {\n"
+        "      \"strategy\": \"xxxx\",\n"
+        "      \"reasoning\": \"xxxx\",\n"
+        "      \"steps\": [\n"
+        "        { \"cell\": \"RxCy\",\n"
+        "          \"action\": \"'assign' or 'eliminate'\",\n"
+        "          \"digit\": x\n"
+        "        },\n"
+        "        { ... }\n"
+        "      ]\n"
+        "    },\n"
+        "    { ... }\n"
+        "  ]\n"
+        "}\n"
     )
 
-    # Call the OpenAI Chat API
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+
+def call_llm(messages: List[dict], prompt_cache_key: str):
+    # Call the OpenAI Chat API.
+    # The prompt cache key routes the requests of one puzzle to the same prompt cache.
     try:
         response = client.chat.completions.create(
-            messages = [
-                {"role": "assistant", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ] + conversation_history,
-            model = "o1-preview",
-#            functions = sudoku_function_schemas,  # Pass the function schemas.
-#            function_call = "auto"         # Let the API decide whether to call a function.
+            messages = messages,
+            model = LLM_MODEL,
+            temperature = 0,
+            response_format = next_moves_response_format,
+            tools = sudoku_tools,           # Pass the function schemas.
+            parallel_tool_calls = True,     # Let the LLM request several calls per turn.
+            extra_body = {"prompt_cache_key": prompt_cache_key},
         )
     except Exception as e:
         raise Exception("OpenAI API call failed: " + str(e))
 
-    return response.choices[0].message
\ No newline at end of file
+    return response.choices[0].message
+
+
+async def call_llm_async(messages: List[dict], prompt_cache_key: str):
+    # Same as call_llm, through the async client.
+    try:
+        response = await async_client.chat.completions.create(
+            messages = messages,
+            model = LLM_MODEL,
+            temperature = 0,
+            response_format = next_moves_response_format,
+            tools = sudoku_tools,
+            parallel_tool_calls = True,
+            extra_body = {"prompt_cache_key": prompt_cache_key},
+        )
+    except Exception as e:
+        raise Exception("OpenAI API call failed: " + str(e))
+
+    return response.choices[0].message
+
+# -----------------------------------------
+# LLM Batch Calls (OpenAI Batch API)
+# -----------------------------------------
+#    For offline work (benchmarks, bulk solving) the Batch API costs half as much and has
+#    higher rate limits, but results can take up to 24 hours. Batch requests cannot run the
+#    helper functions, so each puzzle gets a single completion without tools.
+
+def propose_next_moves_batch(
+    puzzles: List[Dict[str, dict]],
+    max_moves: int = MAX_MOVES,
+    poll_interval: float = 10.0,
+    max_poll_interval: float = 600.0
+) -> List[List[NextMove]]:
+    """
+    Given a list of puzzles, submit one chat completion request per puzzle through the
+    OpenAI Batch API, wait for the batch to finish, and return the proposed moves
+    for each puzzle in the same order. A puzzle whose request failed gets an empty list.
+    """
+    # Write one request line per puzzle.
+    lines = []
+    for n, puzzle in enumerate(puzzles):
+        puzzle_json = orjson.dumps(puzzle)
+        lines.append(orjson.dumps({
+            "custom_id": f"puzzle-{n}",
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": LLM_MODEL,
+                "temperature": 0,
+                "messages": build_messages(puzzle_json.decode(), max_moves, with_tools=False),
+                "response_format": next_moves_response_format,
+                "prompt_cache_key": hashlib.sha256(puzzle_json).hexdigest(),
+            },
+        }))
+
+    # Upload the requests and start the batch.
+    try:
+        batch_file = client.files.create(file=("next_moves_batch.jsonl", b"\n".join(lines)), purpose="batch")
+        batch = client.batches.create(
+            input_file_id = batch_file.id,
+            endpoint = "/v1/chat/completions",
+            completion_window = "24h",
+        )
+    except Exception as e:
+        raise Exception("OpenAI batch submission failed: " + str(e))
+
+    # Poll with exponential backoff until the batch reaches a final status.
+    delay = poll_interval
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        time.sleep(delay)
+        delay = min(delay * 2, max_poll_interval)
+        batch = client.batches.retrieve(batch.id)
+
+    if batch.status != "completed":
+        raise Exception(f"OpenAI batch {batch.id} ended with status {batch.status}.")
+
+    # Output lines can come back in any order, so match them by custom_id.
+    results: List[List[NextMove]] = [[] for _ in puzzles]
+    if batch.output_file_id is None:
+        return results
+    output = client.files.content(batch.output_file_id).content
+    for line in output.splitlines():
+        record = orjson.loads(line)
+        n = int(record["custom_id"].rsplit("-", 1)[1])
+        response = record.get("response")
+        if not response or response.get("status_code") != 200:
+            print(f"CRITICAL: propose_next_moves_batch - Request {record['custom_id']} failed: {record.get('error')}")
+            continue
+        content = response["body"]["choices"][0]["message"]["content"]
+        try:
+            results[n] = NextMoves.model_validate_json(content).moves[:max_moves]
+        except Exception as e:
+            print(f"CRITICAL: propose_next_moves_batch - Failed to parse response for {record['custom_id']}: {e}")
+    return results
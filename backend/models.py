@@ -1,5 +1,5 @@
-from typing import Dict, List, Optional
-from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel, ConfigDict
 
 # -----------------------------------------
 # Pydantic Models for Sudoku Functions
@@ -11,25 +11,26 @@ class SudokuCell(BaseModel):
 # -----------------------------------------
 # Pydantic Models for API Inputs
 # -----------------------------------------
-# The puzzle is represented as a dict mapping cell keys (e.g. "R1C1") to SudokuCell
-# For API endpoints we wrap the puzzle in a model.
+# The puzzle is represented as a dict mapping cell keys (e.g. "R1C1") to SudokuCell-shaped dicts.
+# For API endpoints we wrap the puzzle in a model. The cells are not validated as SudokuCell
+# models here; the logic functions raise ValueError on malformed cells instead.
 class PuzzleInput(BaseModel):
-    puzzle: Dict[str, SudokuCell]
+    puzzle: Dict[str, Dict[str, Any]]
 
 class PuzzleTextInput(BaseModel):
     text: str
 
 class CellAction(BaseModel):
-    puzzle: Dict[str, SudokuCell]
+    puzzle: Dict[str, Dict[str, Any]]
     cell_ref: str
     digit: int
 
 class UnitRequest(BaseModel):
-    puzzle: Dict[str, SudokuCell]
+    puzzle: Dict[str, Dict[str, Any]]
     unit_ref: str  # e.g., "R1", "C5", or "B1"
 
 class RenderRequest(BaseModel):
-    puzzle: Dict[str, SudokuCell]
+    puzzle: Dict[str, Dict[str, Any]]
     as_markdown: bool = True
     as_json: bool = False
     show_candidates: bool = False
@@ -39,28 +40,40 @@ class CheckResult(BaseModel):
     message: Optional[str] = None
 
 class CellDigitRequest(BaseModel):
-    puzzle: Dict[str, SudokuCell]
+    puzzle: Dict[str, Dict[str, Any]]
     cell_ref: str
     digit: int
 
 class CellRequest(BaseModel):
-    puzzle: Dict[str, SudokuCell]
+    puzzle: Dict[str, Dict[str, Any]]
     cell_ref: str
 
 class SubsetCandidatesRequest(BaseModel):
-    puzzle: Dict[str, SudokuCell]
+    puzzle: Dict[str, Dict[str, Any]]
     cell_ref: str
     candidate_list: List[int]
 
 # -----------------------------------------
 # Pydantic Models for LLM
 # -----------------------------------------
+# The LLM models forbid extra keys so that their JSON schema can be used for
+# OpenAI Structured Outputs in strict mode.
 class NextStep(BaseModel):
+    model_config = ConfigDict(extra="forbid")
     cell: str       # e.g. "R1C2"
     action: str     # e.g. "assign" or "eliminate"
     digit: int      # e.g. "the digit to assign or eliminate"
 
 class NextMove(BaseModel):
+    model_config = ConfigDict(extra="forbid")
     strategy: str   # e.g. "hidden singles", "naked pairs", etc.
     reasoning: str  # A detailed description of the reasoning
-    steps: List[NextStep]
\ No newline at end of file
+    steps: List[NextStep]
+
+class NextMoves(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    moves: List[NextMove]
+
+class AppliedMoves(BaseModel):
+    moves: List[NextMove]                # The proposed moves that were applied, in order.
+    puzzle: Dict[str, Dict[str, Any]]    # The puzzle after applying them.
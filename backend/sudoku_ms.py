@@ -2,7 +2,6 @@ from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Dict, List, Optional
 from models import (
-    SudokuCell,
     PuzzleInput,
     PuzzleTextInput,
     CellAction,
@@ -13,17 +12,17 @@ from models import (
     CellRequest,
     SubsetCandidatesRequest,
     NextMove,
+    AppliedMoves,
 )
-from llm_agent import propose_next_move
+from llm_agent import propose_next_move, propose_next_moves, propose_next_moves_many
 from helper import *
-import ssl
+from board import to_bitboard
+import os
 
 app = FastAPI(
     title = "Sudoku Microservice",
     description = "API endpoints for interacting with a sudoku puzzle."
 )
-ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-ssl_context.load_cert_chain('certs/geraldyong-cert.pem', keyfile='certs/geraldyong-priv.pem')
 
 # Enable CORS
 app.add_middleware(
@@ -34,16 +33,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# -------------------------------------------------
-# Helper: Convert API-sent puzzle to internal format
-# -------------------------------------------------
-def convert_puzzle(puzzle_in: Dict[str, SudokuCell]) -> Dict[str, dict]:
-    """Convert each SudokuCell model to a dictionary."""
-    new_puzzle = {}
-    for k, v in puzzle_in.items():
-        # If already a dict, leave it; otherwise convert via .dict()
-        new_puzzle[k] = v if isinstance(v, dict) else v.dict()
-    return new_puzzle
+# Errors raised by the logic functions for a malformed puzzle; mapped to HTTP 400.
+PUZZLE_ERRORS = (ValueError, KeyError, TypeError)
 
 
 # -----------------------------------------
@@ -56,64 +47,77 @@ def load_puzzle_endpoint(input_data: PuzzleTextInput):
     """
     try:
         puzzle = read_puzzle_from_text(input_data.text)
-    except ValueError as e:
+    except PUZZLE_ERRORS as e:
         raise HTTPException(status_code=400, detail=str(e))
     return puzzle
 
 @app.post("/computeCandidates", response_model=Dict[str, dict])
 def compute_candidates_endpoint(input_data: PuzzleInput):
-    puzzle_dict = convert_puzzle(input_data.puzzle)
-    updated = compute_candidates(puzzle_dict)
+    try:
+        updated = compute_candidates(input_data.puzzle)
+    except PUZZLE_ERRORS as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return updated
 
 @app.post("/assignDigit", response_model=Dict[str, dict])
 def assign_digit_endpoint(input_data: CellAction):
-    puzzle_dict = convert_puzzle(input_data.puzzle)
     try:
-        updated = assign_digit(puzzle_dict, input_data.cell_ref, input_data.digit)
-    except ValueError as e:
+        updated = assign_digit(input_data.puzzle, input_data.cell_ref, input_data.digit)
+    except PUZZLE_ERRORS as e:
         raise HTTPException(status_code=400, detail=str(e))
     return updated
 
 @app.post("/eliminateDigit", response_model=Dict[str, dict])
 def eliminate_digit_endpoint(input_data: CellAction):
-    puzzle_dict = convert_puzzle(input_data.puzzle)
     try:
-        updated = eliminate_digit(puzzle_dict, input_data.cell_ref, input_data.digit)
-    except ValueError as e:
+        updated = eliminate_digit(input_data.puzzle, input_data.cell_ref, input_data.digit)
+    except PUZZLE_ERRORS as e:
         raise HTTPException(status_code=400, detail=str(e))
     return updated
 
 @app.post("/scanAndAssign", response_model=Dict[str, dict])
 def scan_and_assign_endpoint(input_data: PuzzleInput):
-    puzzle_dict = convert_puzzle(input_data.puzzle)
-    updated = scan_and_assign(puzzle_dict)
+    try:
+        updated = scan_and_assign(input_data.puzzle)
+    except PUZZLE_ERRORS as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return updated
+
+@app.post("/solvePuzzle", response_model=Dict[str, dict])
+def solve_puzzle_endpoint(input_data: PuzzleInput):
+    try:
+        updated = solve_puzzle(input_data.puzzle)
+    except PUZZLE_ERRORS as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return updated
 
 @app.post("/getUnit", response_model=Dict[str, dict])
 def get_unit_endpoint(input_data: UnitRequest):
-    puzzle_dict = convert_puzzle(input_data.puzzle)
     try:
-        unit_data = get_unit(puzzle_dict, input_data.unit_ref)
-    except ValueError as e:
+        unit_data = get_unit(input_data.puzzle, input_data.unit_ref)
+    except PUZZLE_ERRORS as e:
         raise HTTPException(status_code=400, detail=str(e))
     return unit_data
 
-@app.post("/renderPuzzle")
+@app.post("/renderPuzzle", response_model=Dict[str, str])
 def render_puzzle_endpoint(input_data: RenderRequest):
-    puzzle_dict = convert_puzzle(input_data.puzzle)
-    rendered = render_puzzle(
-        puzzle_dict,
-        as_markdown=input_data.as_markdown,
-        as_json=input_data.as_json,
-        show_candidates=input_data.show_candidates,
-    )
+    try:
+        rendered = render_puzzle(
+            input_data.puzzle,
+            as_markdown=input_data.as_markdown,
+            as_json=input_data.as_json,
+            show_candidates=input_data.show_candidates,
+        )
+    except PUZZLE_ERRORS as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {"rendered": rendered}
 
 @app.post("/checkStrict", response_model=CheckResult)
 def check_strict_endpoint(input_data: PuzzleInput):
-    puzzle_dict = convert_puzzle(input_data.puzzle)
-    result = check_strict_consistency(puzzle_dict)
+    try:
+        result = check_strict_consistency(input_data.puzzle)
+    except PUZZLE_ERRORS as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if result:
         return CheckResult(result=True, message="Strict consistency check passed.")
     else:
@@ -121,8 +125,10 @@ def check_strict_endpoint(input_data: PuzzleInput):
 
 @app.post("/checkCandidates", response_model=CheckResult)
 def check_candidates_endpoint(input_data: PuzzleInput):
-    puzzle_dict = convert_puzzle(input_data.puzzle)
-    result = check_candidate_consistency(puzzle_dict)
+    try:
+        result = check_candidate_consistency(input_data.puzzle)
+    except PUZZLE_ERRORS as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if result:
         return CheckResult(result=True, message="Candidate consistency check passed.")
     else:
@@ -135,7 +141,13 @@ def propose_next_move_endpoint(input_data: PuzzleInput):
     call the LLM-based agent to propose the next move. Returns the cell reference,
     strategy used, and the reasoning.
     """
-    puzzle_dict = convert_puzzle(input_data.puzzle)
+    puzzle_dict = input_data.puzzle
+
+    # Reject a malformed puzzle before paying for an LLM call.
+    try:
+        to_bitboard(puzzle_dict)
+    except PUZZLE_ERRORS as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     try:
         next_move = propose_next_move(puzzle_dict)
@@ -143,14 +155,54 @@ def propose_next_move_endpoint(input_data: PuzzleInput):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/proposeNextMoves", response_model=AppliedMoves)
+def propose_next_moves_endpoint(input_data: PuzzleInput):
+    """
+    Given the JSON representation of a sudoku puzzle (with candidate lists),
+    call the LLM-based agent to propose several independent next moves in one go.
+    The moves are applied in order and checked for strict consistency; the moves
+    up to the first inconsistent one are returned with the updated puzzle.
+    """
+    puzzle_dict = input_data.puzzle
+
+    # Reject a malformed puzzle before paying for an LLM call.
+    try:
+        to_bitboard(puzzle_dict)
+    except PUZZLE_ERRORS as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        next_moves = propose_next_moves(puzzle_dict)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    applied = apply_moves(puzzle_dict, next_moves)
+    return AppliedMoves(moves=applied, puzzle=puzzle_dict)
+
+@app.post("/proposeBatch", response_model=List[List[NextMove]])
+async def propose_batch_endpoint(input_data: List[PuzzleInput]):
+    """
+    Given a list of sudoku puzzles, call the LLM-based agent for all of them concurrently
+    and return the proposed next moves for each puzzle, in the same order.
+    A puzzle for which the agent failed gets an empty list.
+    """
+    # Reject the batch if any puzzle is malformed, before paying for LLM calls.
+    for n, item in enumerate(input_data):
+        try:
+            to_bitboard(item.puzzle)
+        except PUZZLE_ERRORS as e:
+            raise HTTPException(status_code=400, detail=f"Puzzle {n}: {e}")
+    return await propose_next_moves_many([item.puzzle for item in input_data])
+
 @app.post("/findAssignedPeer", response_model=Optional[str])
 def find_assigned_peer_endpoint(request: CellDigitRequest):
     """
     Examine the row, column, and block of the given cell. If the given digit is already assigned
     in any peer, return the peer's cell reference; otherwise, return null.
     """
-    puzzle_dict = convert_puzzle(request.puzzle)
-    peer = find_assigned_peer(puzzle_dict, request.cell_ref, request.digit)
+    try:
+        peer = find_assigned_peer(request.puzzle, request.cell_ref, request.digit)
+    except PUZZLE_ERRORS as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return peer  # Returns None if not found
 
 @app.post("/findCandidatePeers", response_model=List[str])
@@ -159,8 +211,10 @@ def find_candidate_peers_endpoint(request: CellDigitRequest):
     Examine the row, column, and block of the given cell and return a list of cell references
     where the candidate list includes the given digit. Returns an empty list if none.
     """
-    puzzle_dict = convert_puzzle(request.puzzle)
-    peers = find_candidate_peers(puzzle_dict, request.cell_ref, request.digit)
+    try:
+        peers = find_candidate_peers(request.puzzle, request.cell_ref, request.digit)
+    except PUZZLE_ERRORS as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return peers if peers is not None else []
 
 @app.post("/findIdenticalCandidatesPeers", response_model=List[str])
@@ -168,20 +222,26 @@ def find_identical_candidates_peers_endpoint(request: CellRequest):
     """
     Examine the row, column, and block of the given cell and return a list of cell references
     (excluding the given cell) where the candidate list is exactly the same.
+    Returns an empty list if none.
     """
-    puzzle_dict = convert_puzzle(request.puzzle)
-    peers = find_identical_candidates_peers(puzzle_dict, request.cell_ref)
-    return peers
+    try:
+        peers = find_identical_candidates_peers(request.puzzle, request.cell_ref)
+    except PUZZLE_ERRORS as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return peers if peers is not None else []
 
 @app.post("/findSubsetCandidatesPeers", response_model=List[str])
 def find_subset_candidates_peers_endpoint(request: SubsetCandidatesRequest):
     """
     Examine the row, column, and block of the given cell and return a list of cell references
     where the candidate list is a subset of the provided candidate list.
+    Returns an empty list if none.
     """
-    puzzle_dict = convert_puzzle(request.puzzle)
-    peers = find_subset_candidates_peers(puzzle_dict, request.cell_ref, request.candidate_list)
-    return peers
+    try:
+        peers = find_subset_candidates_peers(request.puzzle, request.cell_ref, request.candidate_list)
+    except PUZZLE_ERRORS as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return peers if peers is not None else []
 
 
 # -----------------------------------------
@@ -189,4 +249,13 @@ def find_subset_candidates_peers_endpoint(request: SubsetCandidatesRequest):
 # -----------------------------------------
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    # One worker process per core; the puzzle endpoints are CPU-bound.
+    # Use reload=True (single worker) instead when developing.
+    uvicorn.run(
+        "sudoku_ms:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=os.cpu_count(),
+        ssl_keyfile="certs/geraldyong-priv.pem",
+        ssl_certfile="certs/geraldyong-cert.pem",
+    )
\ No newline at end of file